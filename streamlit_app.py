@@ -4,6 +4,16 @@ import requests
 import numpy as np
 import io
 import traceback
+import zipfile
+import hashlib
+import pickle
+import dbm
+import lz4.frame
+import orjson
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- AUTH ---
 password = st.text_input("🔐Ingrese la contraseña", type="password")
@@ -14,217 +24,338 @@ if password != st.secrets["app_password"]:
 API_KEY = st.secrets["api_key"]
 HEADERS = {"accept": "application/json", "key": API_KEY}
 PAGE_SIZE = 100
+PAGE_BATCH = 8
 ENDPOINTS = {
     "Presupuesto": "https://api.holded.com/api/invoicing/v1/documents/estimate",
     "Proforma": "https://api.holded.com/api/invoicing/v1/documents/proform",
     "Pedido":       "https://api.holded.com/api/invoicing/v1/documents/salesorder"
 }
 PRODUCTS_URL = "https://api.holded.com/api/invoicing/v1/products"
+PRODUCTS_CACHE_FILE = "products.cache"
+
+# one pooled session so every page reuses the same TLS connections
+SESSION = requests.Session()
+SESSION.headers.update(HEADERS)
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.3)
+))
+
+# --- Concurrent Pagination ---
+def _fetch_page(url, page):
+    resp = SESSION.get(url, params={"page": page, "limit": PAGE_SIZE})
+    resp.raise_for_status()
+    data = orjson.loads(resp.content)
+    return data.get("data", data) if isinstance(data, dict) else data
+
+def _fetch_all_pages(url, doc_number=None):
+    # request pages in speculative batches of PAGE_BATCH instead of one
+    # at a time, so a 10-page catalog costs ~2 round-trips instead of 10
+    lower_doc = doc_number.lower() if doc_number is not None else None
+    records = []
+    page = 1
+    with ThreadPoolExecutor(max_workers=PAGE_BATCH) as ex:
+        while True:
+            chunks = list(ex.map(lambda p: _fetch_page(url, p),
+                                 range(page, page + PAGE_BATCH)))
+            done = False
+            for chunk in chunks:
+                if not chunk:
+                    done = True
+                    break
+                records.extend(chunk)
+                if len(chunk) < PAGE_SIZE:
+                    done = True
+                    break
+                # stop paginating as soon as the requested document shows up
+                if lower_doc is not None and any(
+                    str(d.get("docNumber", "")).lower() == lower_doc for d in chunk
+                ):
+                    done = True
+                    break
+            if done:
+                break
+            page += PAGE_BATCH
+    return records
 
 # --- Fetch Documents (Estimates or Sales Orders) ---
-def fetch_documents(url):
-    all_docs = []
-    page = 1
-    while True:
-        resp = requests.get(url, headers=HEADERS, params={"page": page, "limit": PAGE_SIZE})
-        resp.raise_for_status()
-        data = resp.json()
-        chunk = data.get("data", data) if isinstance(data, dict) else data
-        if not chunk:
-            break
-        all_docs.extend(chunk)
-        if len(chunk) < PAGE_SIZE:
-            break
-        page += 1
-    return pd.DataFrame(all_docs)
+@st.cache_data(ttl=60)
+def fetch_documents(url, doc_number=None):
+    df = pd.DataFrame(_fetch_all_pages(url, doc_number))
+    # index docNumbers once so lookups are O(1) dict hits, keeping the
+    # first row on duplicates
+    idx_map = {}
+    if "docNumber" in df.columns:
+        for i, d in enumerate(df["docNumber"]):
+            idx_map.setdefault(str(d).lower(), i)
+    return df, idx_map
 
 # --- Fetch Products ---
+@st.cache_data(ttl=3600)
 def fetch_all_products():
-    all_products = []
-    page = 1
-    while True:
-        resp = requests.get(PRODUCTS_URL, headers=HEADERS, params={"page": page, "limit": PAGE_SIZE})
-        resp.raise_for_status()
-        data = resp.json()
-        chunk = data.get("data", data) if isinstance(data, dict) else data
-        if not chunk:
-            break
-        all_products.extend(chunk)
-        if len(chunk) < PAGE_SIZE:
-            break
-        page += 1
-    return all_products
+    return _fetch_all_pages(PRODUCTS_URL)
 
 # --- Build Lookup Table ---
+LOOKUP_COLS = [
+    "Product", "SKU", "Stock Real", "Weight",
+    "Ancho", "Alto", "Fondo", "Product Line", "Volume"
+]
+
+@st.cache_data(ttl=3600)
 def build_product_lookup(products):
+    # parse the attribute lists once here so the per-query path only does
+    # plain field lookups; the result is a DataFrame indexed by productId
+    # so documents can merge against it directly
     lookup = {}
     for p in products:
         pid = p.get("id") or p.get("productId")
+        ancho = alto = fondo = subcat = None
+        for a in (p.get("attributes") or []):
+            name = a.get("name", "")
+            raw = a.get("value")
+            if name == "Product Line" or name == "3. Product Line":
+                subcat = raw
+            try:
+                val = float(raw)
+            except (TypeError, ValueError):
+                continue
+
+            if name == "Ancho [cm]":
+                ancho = val
+            elif name == "Alto [cm]":
+                alto = val
+            elif name == "Fondo [cm]":
+                fondo = val
+
+        volume = None
+        if None not in (ancho, alto, fondo):
+            volume = (ancho * alto * fondo) / 1_000_000
+
         lookup[pid] = {
             "Product": p.get("name"),
             "SKU": p.get("sku"),
             "Stock Real": p.get("stock"),
             "Weight" : p.get("weight"),
-            "Attributes": p.get("attributes")
+            "Ancho": ancho,
+            "Alto": alto,
+            "Fondo": fondo,
+            "Product Line": subcat,
+            "Volume": volume
         }
+    if not lookup:
+        return pd.DataFrame(columns=LOOKUP_COLS)
+    return pd.DataFrame.from_dict(lookup, orient="index")[LOOKUP_COLS]
+
+# --- Product Lookup with Persistent Cache ---
+LOOKUP_VERSION = "3"  # bump when the lookup record format changes
+
+def _lookup_cache_key():
+    return hashlib.sha256(
+        (API_KEY + date.today().isoformat() + LOOKUP_VERSION).encode()).hexdigest()
+
+def get_product_lookup():
+    key = _lookup_cache_key()
+    try:
+        with dbm.open(PRODUCTS_CACHE_FILE, "c") as db:
+            if key in db:
+                return pickle.loads(lz4.frame.decompress(db[key]))
+    except dbm.error:
+        pass
+    lookup = build_product_lookup(fetch_all_products())
+    try:
+        with dbm.open(PRODUCTS_CACHE_FILE, "c") as db:
+            db[key] = lz4.frame.compress(pickle.dumps(lookup))
+    except dbm.error:
+        pass
     return lookup
 
-# --- Find Row by DocNumber ---
-def get_row_index_by_docnumber(df, doc_number):
-    lower_doc = doc_number.lower()
-    matches = df.index[df['docNumber'].str.lower() == lower_doc]
-    return int(matches[0]) if not matches.empty else None
-
 # --- Build Output Table with Subtotals ---
+OUTPUT_COLS = [
+    "SKU", "Product", "Units", "Subtotal > Units",
+    "Gross Weight (kg)", "Total Weight (kg)", "Subtotal > Total Weight (kg)",
+    "Volume (m³)", "Subtotal > Volume (m³)",
+    "Stock Real", "Insuficiente?", "Falta", "Subtotal > Falta", "Extra"
+]
+DETAIL_COLS = [
+    "Product", "SKU", "Units", "Gross Weight (kg)", "Total Weight (kg)",
+    "Volume (m³)", "Stock Real", "Insuficiente?", "Falta", "Extra"
+]
+NUMERIC_COLS = [
+    "Units", "Subtotal > Units",
+    "Gross Weight (kg)", "Total Weight (kg)", "Subtotal > Total Weight (kg)",
+    "Volume (m³)", "Subtotal > Volume (m³)",
+    "Stock Real", "Falta", "Subtotal > Falta", "Extra"
+]
+
 def get_products_info_for_row(row_idx, df_docs, product_lookup):
-    row = df_docs.loc[row_idx]
     items = df_docs.at[row_idx, "products"] or []
     if not isinstance(items, list):
         raise TypeError(f"Row {row_idx} 'products' must be a list, got {type(items)}")
-
-    grouped = {}
-    for item in items:
-        pid = item.get("productId") if item.get("productId") is not None else item.get("id")
-        units = item.get("units", 0)
-
-        if pid is not None and pid in product_lookup:
-            info = product_lookup[pid]
-            product_name = info.get("Product")
-            sku = info.get("SKU")
-            stock = info.get("Stock Real", 0)
-            attrs = info.get("Attributes") or []
-            net_w = info.get("Weight", 0)
-            ancho = alto = fondo = None
-            subcat = "Sin línea de productos"
-            
-            for a in attrs:
-                name = a.get("name", "")
-                raw = a.get("value")
-                if name == "Product Line" or name == "3. Product Line":
-                    subcat = raw
-                try:
-                    val = float(raw)
-                except:
-                    continue
-        
-                if name == "Ancho [cm]":
-                    ancho = val
-                elif name == "Alto [cm]":
-                    alto = val
-                elif name == "Fondo [cm]":
-                    fondo = val
-           
-        else:
-            product_name = item.get("name") or ""
-            sku = item.get("sku") or ""
-            stock = ""
-            net_w = item.get("weight") or 0.0
-            ancho = alto = fondo = None
-            subcat = "Sin línea de productos"
-
-        volume = None
-        if None not in (ancho, alto, fondo):
-            volume = round((ancho * alto * fondo) / 1_000_000, 5)
-
-        if not sku or not isinstance(stock, (int, float)):
-            insuf = ""
-            falta = 0
-            extra = 0
-        elif stock >= units:
-            insuf = ""
-            falta = 0
-            extra = stock - units
-        else:
-            insuf = "STOCK INSUFICIENTE"
-            falta = abs(stock - units)
-            extra = 0
-
-
-        data = {
-            "Product": product_name,
-            "SKU": sku,
-            "Units": units,
-            "Gross Weight (kg)": net_w,
-            "Total Weight (kg)": round(net_w * units, 3) if net_w and units else None,
-            "Volume (m³)": volume,
-            "Stock Real": stock,
-            "Insuficiente?": insuf,
-            "Falta": falta, 
-            "Extra": extra
-        }
-        grouped.setdefault(subcat, []).append(data)
-
-    # sort each group by SKU
-    for subcat in grouped:
-        grouped[subcat] = sorted(grouped[subcat], key=lambda x: x.get("SKU") or "")
-
-    # construct output
+    if not items:
+        return pd.DataFrame(columns=OUTPUT_COLS)
+
+    items_df = pd.json_normalize(items)
+    for col in ("productId", "id", "units", "name", "sku", "weight"):
+        if col not in items_df.columns:
+            items_df[col] = None
+
+    items_df["pid"] = items_df["productId"].where(items_df["productId"].notna(),
+                                                  items_df["id"])
+    merged = items_df.merge(product_lookup, how="left", left_on="pid", right_index=True)
+    known = merged["pid"].notna() & merged["pid"].isin(product_lookup.index)
+
+    units = pd.to_numeric(merged["units"], errors="coerce").fillna(0)
+    net_w = pd.to_numeric(
+        merged["Weight"].where(known, merged["weight"]), errors="coerce")
+    net_w = net_w.where(known, net_w.fillna(0.0))
+    total_w = (net_w * units).where((net_w.fillna(0) != 0) & (units != 0))
+    volume = pd.to_numeric(merged["Volume"], errors="coerce")
+
+    sku = merged["SKU"].where(known, merged["sku"]).fillna("")
+    # NaN (not "") for unknown stock keeps the column a native float dtype
+    stock = pd.to_numeric(merged["Stock Real"].where(known), errors="coerce")
+
+    # branchless stock/shortfall computation on plain float arrays
+    stock_arr = stock.to_numpy(dtype=float)
+    units_arr = units.to_numpy(dtype=float)
+    valid = (sku.astype(str) != "").to_numpy() & ~np.isnan(stock_arr)
+    short = valid & (stock_arr < units_arr)
+    covered = valid & (stock_arr >= units_arr)
+
+    detail = pd.DataFrame({
+        "Product": merged["Product"].where(known, merged["name"].fillna("")),
+        "SKU": sku,
+        "Units": units,
+        "Gross Weight (kg)": net_w,
+        "Total Weight (kg)": total_w,
+        "Volume (m³)": volume,
+        "Stock Real": stock,
+        "Insuficiente?": np.where(short, "STOCK INSUFICIENTE", ""),
+        "Falta": np.where(short, units_arr - stock_arr, 0.0),
+        "Extra": np.where(covered, stock_arr - units_arr, 0.0),
+        "subcat": merged["Product Line"].fillna("Sin línea de productos"),
+    })
+
+    # sort by SKU within each subcat, keeping first-appearance subcat order
+    group_order = {s: i for i, s in enumerate(pd.unique(detail["subcat"]))}
+    detail = (detail.assign(_ord=detail["subcat"].map(group_order),
+                            _sku=detail["SKU"].astype(str))
+                    .sort_values(["_ord", "_sku"], kind="stable"))
+
+    # one vectorized aggregation pass for every subtotal
+    grouped = detail.groupby("subcat", sort=False)
+    subtotals = grouped.agg({
+        "Units": "sum",
+        "Total Weight (kg)": "sum",
+        "Volume (m³)": "sum",
+        "Falta": "sum"
+    })
+
+    # construct output (np.nan, not "", in numeric cells so the resulting
+    # columns come out as native float dtypes and need no later coercion)
     output = []
-    for subcat, prods in grouped.items():
-        output.append({k: "" for k in [
-            "SKU", "Product", "Units", "Subtotal > Units",
-            "Gross Weight (kg)", "Total Weight (kg)", "Subtotal > Total Weight (kg)",
-            "Volume (m³)", "Subtotal > Volume (m³)",
-            "Stock Real", "Insuficiente?", "Falta", "Subtotal > Falta", "Extra"
-        ]})
-        output[-1]["Product"] = f"——— {subcat} ———"
-        output.extend(prods)
-
-        tmp = pd.DataFrame(prods)
-        for c in ["Units", "Total Weight (kg)", "Volume (m³)", "Falta"]:
-            tmp[c] = pd.to_numeric(tmp[c], errors="coerce")
+    for subcat, g in grouped:
+        sub = subtotals.loc[subcat]
+        header = {k: (np.nan if k in NUMERIC_COLS else "") for k in OUTPUT_COLS}
+        header["Product"] = f"——— {subcat} ———"
+        output.append(header)
+        output.extend(g[DETAIL_COLS].to_dict("records"))
         output.append({
             "SKU": "",
             "Product": f"                         Subtotal {subcat}",
-            "Units": "",
-            "Subtotal > Units": round(tmp["Units"].sum(min_count=1) or 0, 1),
-            "Gross Weight (kg)": "",
-            "Total Weight (kg)": "",
-            "Subtotal > Total Weight (kg)": round(tmp["Total Weight (kg)"].sum(min_count=1) or 0, 2),
-            "Volume (m³)": "",
-            "Subtotal > Volume (m³)": round(tmp["Volume (m³)"].sum(min_count=1) or 0, 5),
-            "Stock Real": "",
+            "Units": np.nan,
+            "Subtotal > Units": sub["Units"],
+            "Gross Weight (kg)": np.nan,
+            "Total Weight (kg)": np.nan,
+            "Subtotal > Total Weight (kg)": sub["Total Weight (kg)"],
+            "Volume (m³)": np.nan,
+            "Subtotal > Volume (m³)": sub["Volume (m³)"],
+            "Stock Real": np.nan,
             "Insuficiente?": "",
-            "Falta": "",
-            "Subtotal > Falta": round(tmp["Falta"].sum(min_count=1) or 0, 0),
-            "Extra": ""
+            "Falta": np.nan,
+            "Subtotal > Falta": sub["Falta"],
+            "Extra": np.nan
         })
 
-    if not output:
-        return pd.DataFrame(columns=[
-            "SKU", "Product", "Units", "Subtotal > Units",
-            "Gross Weight (kg)", "Total Weight (kg)", "Subtotal > Total Weight (kg)",
-            "Volume (m³)", "Subtotal > Volume (m³)",
-            "Stock Real", "Insuficiente?", "Falta", "Subtotal > Falta", "Extra"
-        ])
-
-    df = pd.DataFrame(output)
-
-    # fill NaNs in subtotals
-    mask = df["Product"].str.contains("Subtotal", na=False)
-    for col in ["Subtotal > Units", "Subtotal > Total Weight (kg)", "Subtotal > Volume (m³)", "Subtotal > Falta"]:
-        df.loc[mask, col] = df.loc[mask, col].fillna(0)
-
-    # reorder columns
-    cols = [
-        "SKU", "Product", "Units", "Subtotal > Units",
-        "Gross Weight (kg)", "Total Weight (kg)", "Subtotal > Total Weight (kg)",
-        "Volume (m³)", "Subtotal > Volume (m³)",
-        "Stock Real", "Insuficiente?", "Falta", "Subtotal > Falta", "Extra"
-    ]
-    return df[cols]
+    # overall TOTAL row, summed from the per-subcat subtotals (no second
+    # aggregation pass, no pd.concat in the caller)
+    output.append({
+        "SKU": "",
+        "Product": "——— TOTAL ———",
+        "Units": np.nan,
+        "Subtotal > Units": subtotals["Units"].sum(),
+        "Gross Weight (kg)": np.nan,
+        "Total Weight (kg)": np.nan,
+        "Subtotal > Total Weight (kg)": subtotals["Total Weight (kg)"].sum(),
+        "Volume (m³)": np.nan,
+        "Subtotal > Volume (m³)": subtotals["Volume (m³)"].sum(),
+        "Stock Real": np.nan,
+        "Insuficiente?": "",
+        "Falta": np.nan,
+        "Subtotal > Falta": subtotals["Falta"].sum(),
+        "Extra": np.nan
+    })
+
+    return pd.DataFrame(output)[OUTPUT_COLS]
+
+# --- Excel Export ---
+def _to_excel_bytes(df, sheet_name):
+    # no constant_memory here: that mode flushes rows as they are written,
+    # but pandas writes cells column-by-column, so flushed rows would be
+    # silently dropped from the workbook
+    buf = io.BytesIO()
+    with pd.ExcelWriter(buf, engine="xlsxwriter") as w:
+        df.to_excel(w, index=False, sheet_name=sheet_name)
+    return buf.getvalue()
+
+@st.cache_data
+def make_download_zip(df_res, summary, doc_number):
+    # built once per distinct result frame, not on every rerun
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(f"{doc_number}_stock.xlsx", _to_excel_bytes(df_res, "Stock"))
+        z.writestr(f"{doc_number}_pallets.xlsx", _to_excel_bytes(summary, "Pallets"))
+    return buf.getvalue()
 
 # --- UI ---
 st.title("📦Información del Documento")
 
 doc_input = st.text_input("Ingrese el número de documento (Presupuesto, Proforma o Pedido):")
 
+if st.button("🔄 Actualizar datos"):
+    st.session_state.pop("product_lookup", None)
+    st.session_state.pop("documents", None)
+    st.session_state.pop("styled_cache", None)
+    st.cache_data.clear()
+    # drop today's persistent catalog entry so the next query refetches
+    try:
+        with dbm.open(PRODUCTS_CACHE_FILE, "c") as db:
+            if _lookup_cache_key() in db:
+                del db[_lookup_cache_key()]
+    except dbm.error:
+        pass
+
 def find_document_in_all(doc_number):
-    for doc_type, url in ENDPOINTS.items():
-        df = fetch_documents(url)
-        idx = get_row_index_by_docnumber(df, doc_number)
-        if idx is not None:
-            return doc_type, df, idx
+    # hits are kept in session state so widget-driven reruns skip the
+    # network search entirely
+    docs_cache = st.session_state.setdefault("documents", {})
+    cached = docs_cache.get(doc_number.lower())
+    if cached is not None:
+        return cached
+    with ThreadPoolExecutor(max_workers=len(ENDPOINTS)) as ex:
+        futures = {
+            ex.submit(fetch_documents, url, doc_number): doc_type
+            for doc_type, url in ENDPOINTS.items()
+        }
+        for fut in as_completed(futures):
+            df, idx_map = fut.result()
+            idx = idx_map.get(doc_number.lower())
+            if idx is not None:
+                for other in futures:
+                    other.cancel()
+                docs_cache[doc_number.lower()] = (futures[fut], df, idx)
+                return docs_cache[doc_number.lower()]
     return None, None, None
 
 if doc_input:
@@ -235,8 +366,9 @@ if doc_input:
                 st.error("Documento no encontrado en Presupuestos, Proformas o Pedidos.")
             else:
                 original = df_docs.loc[idx, 'docNumber']
-                all_prods = fetch_all_products()
-                lookup = build_product_lookup(all_prods)
+                if "product_lookup" not in st.session_state:
+                    st.session_state.product_lookup = get_product_lookup()
+                lookup = st.session_state.product_lookup
                 df_res = get_products_info_for_row(idx, df_docs, lookup)
 
                 if df_res.empty:
@@ -244,72 +376,49 @@ if doc_input:
                 else:
                     st.success(f"{doc_type} '{original}' loaded!")
 
-                    # numeric conversion on all numeric-looking cols
-                    num_cols = [
-                        "Units","Subtotal > Units",
-                        "Gross Weight (kg)","Total Weight (kg)","Subtotal > Total Weight (kg)",
-                        "Volume (m³)","Subtotal > Volume (m³)",
-                        "Stock Real","Falta","Subtotal > Falta"
-                    ]
-                    for c in num_cols:
-                        df_res[c] = pd.to_numeric(df_res[c], errors='coerce')
-
-                    # overall TOTAL row
-                    totals = {
-                        "SKU": "",
-                        "Product": "——— TOTAL ———",
-                        "Units": "",
-                        "Subtotal > Units": df_res["Subtotal > Units"].sum(min_count=1),
-                        "Gross Weight (kg)": "",
-                        "Total Weight (kg)": "",
-                        "Subtotal > Total Weight (kg)": df_res["Subtotal > Total Weight (kg)"].sum(min_count=1),
-                        "Volume (m³)": "",
-                        "Subtotal > Volume (m³)": df_res["Subtotal > Volume (m³)"].sum(min_count=1),
-                        "Stock Real": "",
-                        "Insuficiente?": "",
-                        "Falta": "",
-                        "Subtotal > Falta": df_res["Subtotal > Falta"].sum(min_count=1)
-                    }
-                    df_res = pd.concat([df_res, pd.DataFrame([totals])], ignore_index=True)
-
-                    # styling
-                    def highlight_rows(r):
-                        prod = str(r["Product"])
-                        if prod.startswith("———"):
-                            return ["font-weight: bold; background-color: #f0f0f0"] * len(r)
-                        if prod.strip().startswith("Subtotal"):
-                            return ["font-weight: bold; text-align: right"] * len(r)
-                        return [""] * len(r)
-
-                    numeric_cols = [
-                        "Units", "Subtotal > Units",
-                        "Gross Weight (kg)", "Total Weight (kg)", "Subtotal > Total Weight (kg)",
-                        "Volume (m³)", "Subtotal > Volume (m³)",
-                        "Stock Real", "Falta", "Subtotal > Falta"
-                    ]
-                    
-                    # make sure they’re numeric (you probably already do this)
-                    for c in numeric_cols:
-                        df_res[c] = pd.to_numeric(df_res[c], errors="coerce")
-                    
-                    styled = (
-                        df_res.style
-                              .apply(highlight_rows, axis=1)
-                              .format({
-                                  "Units": "{:,.0f}",
-                                  "Subtotal > Units": "{:,.0f}",
-                                  "Gross Weight (kg)": "{:.3f}",
-                                  "Total Weight (kg)": "{:.2f}",
-                                  "Subtotal > Total Weight (kg)": "{:.2f}",
-                                  "Volume (m³)": "{:.3f}",
-                                  "Subtotal > Volume (m³)": "{:.3f}",
-                                  "Stock Real": "{:,.0f}",
-                                  "Falta": "{:,.0f}",
-                                  "Subtotal > Falta": "{:,.0f}"
-                              }, na_rep="—")
-                    )
-
-                    st.dataframe(styled)
+                    # styling (HTML cached in session state so reruns with
+                    # the same frame skip the whole Styler pass)
+                    style_key = hashlib.md5(
+                        pd.util.hash_pandas_object(df_res, index=True).values
+                    ).hexdigest()
+                    styled_cache = st.session_state.setdefault("styled_cache", {})
+
+                    if style_key not in styled_cache:
+                        def highlight_rows(df):
+                            # one vectorized pass over the whole table
+                            prod = df["Product"].astype(str)
+                            header_mask = prod.str.startswith("———")
+                            sub_mask = prod.str.strip().str.startswith("Subtotal")
+                            styles = np.where(
+                                header_mask, "font-weight: bold; background-color: #f0f0f0",
+                                np.where(sub_mask, "font-weight: bold; text-align: right", "")
+                            )
+                            return pd.DataFrame(
+                                np.tile(styles[:, None], (1, df.shape[1])),
+                                index=df.index, columns=df.columns
+                            )
+
+                        styled = (
+                            df_res.style
+                                  .hide(axis="index")
+                                  .apply(highlight_rows, axis=None)
+                                  .format({
+                                      "Units": "{:,.0f}",
+                                      "Subtotal > Units": "{:,.0f}",
+                                      "Gross Weight (kg)": "{:.3f}",
+                                      "Total Weight (kg)": "{:.2f}",
+                                      "Subtotal > Total Weight (kg)": "{:.2f}",
+                                      "Volume (m³)": "{:.3f}",
+                                      "Subtotal > Volume (m³)": "{:.3f}",
+                                      "Stock Real": "{:,.0f}",
+                                      "Falta": "{:,.0f}",
+                                      "Subtotal > Falta": "{:,.0f}",
+                                      "Extra": "{:,.0f}"
+                                  }, na_rep="—")
+                        )
+                        styled_cache[style_key] = styled.to_html()
+
+                    st.markdown(styled_cache[style_key], unsafe_allow_html=True)
 
                     # pallet summary
                     total_units  = df_res["Units"].sum(min_count=1) or 0
@@ -335,28 +444,12 @@ if doc_input:
                     st.subheader("📊 Estimated Pallet Summary")
                     st.dataframe(summary)
 
-                    # download stock Excel
-                    buf1 = io.BytesIO()
-                    with pd.ExcelWriter(buf1, engine="openpyxl") as w:
-                        df_res.to_excel(w, index=False)
-                    buf1.seek(0)
-                    st.download_button(
-                        "📥 Download Excel (Stock)",
-                        buf1,
-                        file_name=f"{original}_stock.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                    )
-
-                    # download pallets Excel
-                    buf2 = io.BytesIO()
-                    with pd.ExcelWriter(buf2, engine="openpyxl") as w:
-                        summary.to_excel(w, index=False)
-                    buf2.seek(0)
+                    # download both Excels as one zip
                     st.download_button(
-                        "📥 Download Excel (Pallets)",
-                        buf2,
-                        file_name=f"{original}_pallets.xlsx",
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                        "📥 Download Excel (Stock + Pallets)",
+                        make_download_zip(df_res, summary, original),
+                        file_name=f"{original}_excel.zip",
+                        mime="application/zip"
                     )
         except Exception as e:
             st.error(f"Something went wrong: {e}")